@@ -1,5 +1,36 @@
 import csv
-from thefuzz import fuzz
+import hashlib
+import math
+import os
+from itertools import islice
+
+import numpy as np
+import xxhash
+from datasketch import LeanMinHash, MinHash, MinHashLSH
+from rapidfuzz import fuzz, process
+
+# thefuzz rounded ratio() half to even, so its ">= 99" is "> 98.5" here, and score_cutoff is inclusive
+SIMILARITY_CUTOFF = math.nextafter(98.5, 100)
+# Near-duplicate candidates are found with MinHash LSH over character shingles and
+# then confirmed with fuzz.ratio. Edits that keep a text above the cutoff can bring its
+# shingle Jaccard similarity down to about 0.75. LSH_WEIGHTS favours recall over
+# precision, giving 20 bands of 6 rows, which finds a pair at Jaccard 0.75 about 98% of
+# the time and at 0.8 about 99.8% of the time. So roughly 1-2% of the near-duplicates
+# closest to the cutoff are still missed and kept.
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+LSH_THRESHOLD = 0.7
+LSH_WEIGHTS = (0.1, 0.9)
+
+# Rows are read and CJK-filtered this many at a time
+CHUNK_SIZE = 10000
+
+CJK_RANGES = (
+    (0x4E00, 0x9FFF),  # CJK Unified Ideographs
+    (0x3040, 0x309F),  # Hiragana
+    (0x30A0, 0x30FF),  # Katakana
+    (0xFF00, 0xFFEF),  # Full-width characters
+)
 
 
 def deduplicate_csv(input_file: str, output_file: str):
@@ -7,55 +38,83 @@ def deduplicate_csv(input_file: str, output_file: str):
     Deduplicates a CSV file based on 99% similarity in the third column,
     removes rows with missing third column, and filters out rows where
     more than 10% of the characters in the third column are Chinese or Japanese.
+    Texts that are equal ignoring case and surrounding whitespace always count
+    as duplicates, even when their case-sensitive similarity is below 99%.
     """
-    def is_cjk(character):
-        """Check if a character is Chinese, Japanese, or Korean."""
-        return any([
-            "\u4e00" <= character <= "\u9fff",  # CJK Unified Ideographs
-            "\u3040" <= character <= "\u309f",  # Hiragana
-            "\u30a0" <= character <= "\u30ff",  # Katakana
-            "\uff00" <= character <= "\uffef"   # Full-width characters
-        ])
-
-    def cjk_ratio(text):
-        """Calculate the ratio of CJK characters in the text."""
-        if not text:
-            return 0
-        cjk_count = sum(1 for char in text if is_cjk(char))
-        return cjk_count / len(text)
-
-    seen = []
-    unique_rows = []
-
-    with open(input_file, mode="r", newline="", encoding="utf-8") as infile:
-        reader = csv.reader(infile)
-        header = next(reader)  # Assuming the first row is the header
-        unique_rows.append(header)
+    def cjk_ratios(texts):
+        """Calculate the ratio of CJK characters in each of the non-empty texts."""
+        # One code point per element, for all the texts back to back
+        codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+        is_cjk = np.zeros(len(codes), dtype=bool)
+        for low, high in CJK_RANGES:
+            is_cjk |= (codes >= low) & (codes <= high)
 
-        for row in reader:
-            if len(row) < 3 or not row[2].strip():
-                # Skip rows with missing or empty third column
-                continue
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        starts = np.cumsum(lengths) - lengths
+        return np.add.reduceat(is_cjk, starts) / lengths
 
-            if cjk_ratio(row[2]) > 0.1:
-                # Skip rows where more than 10% of the text is CJK characters
+    def text_rows(reader):
+        """Yields the rows worth deduplicating, filtering them a chunk at a time."""
+        while chunk := list(islice(reader, CHUNK_SIZE)):
+            # Skip rows with missing or empty third column
+            rows = [row for row in chunk if len(row) >= 3 and row[2].strip()]
+            if not rows:
                 continue
 
-            is_duplicate = False
-            for seen_row in seen:
-                # Check for 99% similarity with existing rows
-                if fuzz.ratio(row[2], seen_row[2]) >= 99:
-                    is_duplicate = True
-                    break
+            # Skip rows where more than 10% of the text is CJK characters
+            for row, ratio in zip(rows, cjk_ratios([row[2] for row in rows])):
+                if ratio <= 0.1:
+                    yield row
+
+    def min_hash(text):
+        """Builds a MinHash over the character shingles of the text."""
+        m = MinHash(
+            num_perm=NUM_PERM,
+            hashfunc=xxhash.xxh32_intdigest,
+            permutations=template.permutations,
+            scheme=template.scheme,
+        )
+        m.update_batch({text[i:i + SHINGLE_SIZE].encode() for i in range(len(text) - SHINGLE_SIZE + 1)})
+        return LeanMinHash(m)
 
-            if not is_duplicate:
-                seen.append(row)
-                unique_rows.append(row)
+    # Generating the random permutations is most of the cost of a MinHash, so they are shared
+    template = MinHash(num_perm=NUM_PERM)
 
-    # Write the deduplicated rows to a new file
-    with open(output_file, mode="w", newline="", encoding="utf-8") as outfile:
+    # Digests of the normalized texts already seen, checked before any fuzzy scoring
+    seen_hashes = set()
+    seen_texts = []
+    lsh = MinHashLSH(threshold=LSH_THRESHOLD, num_perm=NUM_PERM, weights=LSH_WEIGHTS)
+
+    # The output is written while the input is still being read, so they can't be the same file
+    if os.path.exists(output_file) and os.path.samefile(input_file, output_file):
+        raise ValueError(f"Output file {output_file} is the same file as the input file")
+
+    # Unique rows are written out as soon as they are found
+    with open(input_file, mode="r", newline="", encoding="utf-8") as infile, \
+            open(output_file, mode="w", newline="", encoding="utf-8") as outfile:
+        reader = csv.reader(infile)
         writer = csv.writer(outfile)
-        writer.writerows(unique_rows)
+        header = next(reader)  # Assuming the first row is the header
+        writer.writerow(header)
+
+        for row in text_rows(reader):
+            # Skip exact duplicates, ignoring case and surrounding whitespace
+            digest = hashlib.blake2b(row[2].strip().casefold().encode(), digest_size=16).digest()
+            if digest in seen_hashes:
+                continue
+            seen_hashes.add(digest)
+
+            # Texts too short to shingle can only be 99% similar when identical
+            if len(row[2]) >= SHINGLE_SIZE:
+                # Check for 99% similarity with the existing rows the LSH index suggests
+                m = min_hash(row[2])
+                candidates = [seen_texts[key] for key in lsh.query(m)]
+                if process.extractOne(row[2], candidates, scorer=fuzz.ratio, score_cutoff=SIMILARITY_CUTOFF):
+                    continue
+                lsh.insert(len(seen_texts), m)
+                seen_texts.append(row[2])
+
+            writer.writerow(row)
 
     print(f"Deduplication complete. Output written to {output_file}")
 
@@ -1,73 +1,88 @@
+import os
 import boto3
-from hashlib import sha256
-from collections import defaultdict
+import xxhash
+from botocore.config import Config
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-TABLE_NAME = "nosol-reports"
-dynamodb = boto3.client("dynamodb")
-
-
-def fetch_all_records():
-    """Fetches all records from the DynamoDB table."""
-    records = []
-    last_evaluated_key = None
-
-    while True:
-        params = {"TableName": TABLE_NAME}
-        if last_evaluated_key:
-            params["ExclusiveStartKey"] = last_evaluated_key
-
-        response = dynamodb.scan(**params)
-        records.extend(response.get("Items", []))
-        last_evaluated_key = response.get("LastEvaluatedKey")
-
-        if not last_evaluated_key:
-            break
-
-    return records
+from dynamo import BATCH_SIZE, delete_ids
 
-
-def delete_record(record_id):
-    """Deletes a record from DynamoDB by ID."""
-    try:
-        dynamodb.delete_item(
-            TableName=TABLE_NAME,
-            Key={"id": {"S": record_id}}
-        )
-        print(f"Deleted record with ID: {record_id}")
-    except Exception as e:
-        print(f"Failed to delete record with ID {record_id}. Error: {e}")
+TABLE_NAME = "nosol-reports"
+# Number of segments scanned concurrently when fetching the whole table
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "16"))
+if SCAN_SEGMENTS < 1:
+    raise ValueError(f"SCAN_SEGMENTS must be at least 1, got {SCAN_SEGMENTS}")
+# One pooled connection per scan segment, plus one for the deletes sent during the scan
+dynamodb = boto3.client("dynamodb", config=Config(max_pool_connections=SCAN_SEGMENTS + 1))
+
+
+def scan_page(segment: int, total_segments: int, last_evaluated_key=None):
+    """Fetches one page of a parallel scan segment."""
+    params = {"TableName": TABLE_NAME, "Segment": segment, "TotalSegments": total_segments}
+    if last_evaluated_key:
+        params["ExclusiveStartKey"] = last_evaluated_key
+
+    response = dynamodb.scan(**params)
+    return segment, response.get("Items", []), response.get("LastEvaluatedKey")
+
+
+def iter_all_records(total_segments: int = SCAN_SEGMENTS):
+    """Yields all records from the DynamoDB table page by page, scanning its segments in parallel."""
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        pending = {executor.submit(scan_page, segment, total_segments) for segment in range(total_segments)}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                segment, items, last_evaluated_key = future.result()
+                if last_evaluated_key:
+                    # Request the segment's next page before handing this one out
+                    pending.add(executor.submit(scan_page, segment, total_segments, last_evaluated_key))
+                yield from items
+
+
+def delete_records(record_ids: list):
+    """Deletes records from DynamoDB by ID, in batches."""
+    failed = delete_ids(dynamodb, TABLE_NAME, record_ids)
+    for record_id in record_ids:
+        if record_id in failed:
+            print(f"Failed to delete record with ID {record_id}. Error: {failed[record_id]}")
+        else:
+            print(f"Deleted record with ID: {record_id}")
 
 
 def find_and_delete_duplicates():
     """Finds and deletes duplicate records based on the raw content field."""
-    records = fetch_all_records()
-    print(f"Fetched {len(records)} records from the table.")
-
-    # Track unique records and duplicates
-    content_hash_map = defaultdict(list)
-    duplicates = []
-
-    # Use hash of raw content to identify duplicates
-    for item in records:
+    # Track the 16-byte content digests seen so far, anything seen again is a duplicate
+    seen = set()
+    record_count = 0
+    duplicate_count = 0
+    pending_deletes = []
+
+    # Use hash of raw content to identify duplicates, deleting them as the scan goes
+    for item in iter_all_records():
+        record_count += 1
         record_id = item["id"]["S"]
         content_raw = item["content"]["B"]  # Raw bytes, no decoding
 
-        # Create a hash of the raw content
-        content_hash = sha256(content_raw).hexdigest()
+        # Create a hash of the raw content, it is only a dedup key so it needn't be cryptographic
+        content_hash = xxhash.xxh128_digest(content_raw)
 
-        if content_hash in content_hash_map:
-            duplicates.append(record_id)
+        if content_hash in seen:
+            duplicate_count += 1
+            pending_deletes.append(record_id)
+            if len(pending_deletes) >= BATCH_SIZE:
+                delete_records(pending_deletes)
+                pending_deletes.clear()
         else:
-            content_hash_map[content_hash].append(record_id)
-
-    print(f"Found {len(duplicates)} duplicate records.")
+            seen.add(content_hash)
 
-    # Delete duplicates
-    for record_id in duplicates:
-        delete_record(record_id)
+    # Delete the remaining duplicates
+    delete_records(pending_deletes)
 
-    remaining_records = len(content_hash_map)
-    print(f"Deleted {len(duplicates)} duplicates.")
+    remaining_records = len(seen)
+    print(f"Fetched {record_count} records from the table.")
+    print(f"Found {duplicate_count} duplicate records.")
+    print(f"Deleted {duplicate_count} duplicates.")
     print(f"Remaining unique records: {remaining_records}")
 
 
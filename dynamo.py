@@ -0,0 +1,76 @@
+import time
+from itertools import islice
+
+# BatchWriteItem accepts at most 25 put or delete requests per call
+BATCH_SIZE = 25
+MAX_RETRIES = 5
+RETRY_DELAY = 0.05
+
+
+def chunked(items, size: int = BATCH_SIZE):
+    """Splits an iterable into consecutive lists of at most the given size."""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def write_batch(client, table_name: str, requests: list) -> list:
+    """
+    Sends a batch of write requests to DynamoDB, retrying unprocessed items
+    with exponential backoff. Returns the requests that were still unprocessed
+    after the last retry.
+    """
+    pending = requests
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(RETRY_DELAY * 2 ** attempt)
+
+        response = client.batch_write_item(RequestItems={table_name: pending})
+        pending = response.get("UnprocessedItems", {}).get(table_name, [])
+        if not pending:
+            break
+
+    return pending
+
+
+def write_requests(client, table_name: str, requests_by_id: dict) -> dict[str, str]:
+    """
+    Sends write requests keyed by item ID, in batches. Returns the error for
+    each ID whose request could not be written.
+    """
+    failed = {}
+    for chunk in chunked(requests_by_id.items()):
+        try:
+            unprocessed = write_batch(client, table_name, [request for _, request in chunk])
+        except Exception as e:
+            failed.update((item_id, str(e)) for item_id, _ in chunk)
+            continue
+
+        for request in unprocessed:
+            if "PutRequest" in request:
+                item_id = request["PutRequest"]["Item"]["id"]["S"]
+            else:
+                item_id = request["DeleteRequest"]["Key"]["id"]["S"]
+            failed[item_id] = "still unprocessed after retries"
+
+    return failed
+
+
+def delete_ids(client, table_name: str, ids) -> dict[str, str]:
+    """
+    Deletes items by ID, in batches. Returns the error for each ID that could
+    not be deleted.
+    """
+    requests_by_id = {item_id: {"DeleteRequest": {"Key": {"id": {"S": item_id}}}} for item_id in ids}
+    return write_requests(client, table_name, requests_by_id)
+
+
+def put_items(client, table_name: str, items) -> dict[str, str]:
+    """
+    Writes items, in batches. An item replaces an earlier one with the same ID,
+    as consecutive put_item calls would. Returns the error for each ID that
+    could not be written.
+    """
+    # BatchWriteItem rejects a batch with repeated keys, so only the last copy is sent
+    requests_by_id = {item["id"]["S"]: {"PutRequest": {"Item": item}} for item in items}
+    return write_requests(client, table_name, requests_by_id)
@@ -1,8 +1,10 @@
 import boto3
-import json
+import orjson
 import os
 import sys
 
+from dynamo import chunked, put_items
+
 TABLE_NAME = "nosol-reports"
 dynamodb = boto3.client("dynamodb")
 
@@ -19,17 +21,17 @@ def import_json_to_dynamodb(directory: str):
         file_path = os.path.join(directory, file_name)
         print(f"Processing file: {file_path}")
 
-        with open(file_path, "r") as file:
-            items = [json.loads(line) for line in file]
-
         all_successful = True
-        for item in items:
-            try:
-                dynamodb.put_item(TableName=TABLE_NAME, Item=item["Item"])
-                print(f"Successfully imported item with ID: {item['Item']['id']['S']}")
-            except Exception as e:
-                all_successful = False
-                print(f"Failed to import item with ID: {item['Item']['id']['S']}. Error: {e}")
+        with open(file_path, "rb") as file:
+            # Items are parsed and imported a batch at a time rather than loading the whole file
+            for chunk in chunked(orjson.loads(line)["Item"] for line in file):
+                failed = put_items(dynamodb, TABLE_NAME, chunk)
+                for item_id in dict.fromkeys(item["id"]["S"] for item in chunk):
+                    if item_id in failed:
+                        all_successful = False
+                        print(f"Failed to import item with ID: {item_id}. Error: {failed[item_id]}")
+                    else:
+                        print(f"Successfully imported item with ID: {item_id}")
 
         if all_successful:
             try:
@@ -2,14 +2,20 @@ import argparse
 import base64
 import binascii
 import csv
-from io import BytesIO
 
 import boto3
 
 from constants import REPLACEMENTS
+from dynamo import BATCH_SIZE, delete_ids
 
 TABLE_NAME = "nosol-reports"
+# Attributes read by process_item, aliased since some of them are DynamoDB reserved words
+REPORT_ATTRIBUTES = ("id", "sender", "content", "type", "reason", "suggested_classification")
+# Page size for interactive review, a full 1 MB page is far more than anyone reviews at once
+REVIEW_PAGE_SIZE = 100
 dynamodb = boto3.client("dynamodb")
+# Every needle in REPLACEMENTS is a single character, so all of them fit in one translate table
+REPLACEMENTS_TABLE = str.maketrans(REPLACEMENTS)
 
 
 def get_text(input_data: bytes) -> str:
@@ -18,72 +24,76 @@ def get_text(input_data: bytes) -> str:
     START = 2
     # noinspection PyPep8Naming
     END = 3
-    cursor = BytesIO(input_data)
+    position = 0
     result = bytearray()
 
-    while cursor.tell() < len(input_data):
-        byte = cursor.read(1)[0]
-        if byte == START:
-            cursor.read(1)  # Skip kind
-            length = get_int(cursor)  # Length of the data
-            cursor.read(length)  # Skip the data
-            end_byte = cursor.read(1)[0]
-            assert end_byte == END, "Invalid format: missing END marker"
-            continue
-
-        result.append(byte)
+    while position < len(input_data):
+        # Copy the whole run of literal bytes up to the next START marker at once
+        start = input_data.find(START, position)
+        if start == -1:
+            result += input_data[position:]
+            break
+
+        result += input_data[position:start]
+        position = start + 2  # Skip START and kind
+        length, position = get_int(input_data, position)  # Length of the data
+        position += length  # Skip the data
+        end_byte = input_data[position]
+        position += 1
+        assert end_byte == END, "Invalid format: missing END marker"
 
     return result.decode("utf-8")
 
 
-def get_int(cursor: BytesIO) -> int:
-    """Reads an integer from the cursor based on variable-length encoding."""
-    marker = cursor.read(1)[0]
+def get_int(data: bytes, position: int) -> tuple[int, int]:
+    """
+    Reads an integer at the position based on variable-length encoding.
+    Returns the integer and the position just after it.
+    """
+    marker = data[position]
+    position += 1
     if marker < 0xD0:
-        return marker - 1
+        return marker - 1, position
 
     marker = (marker + 1) & 0xF
     result = bytearray(4)
 
     for i in range(4):
         if marker & (1 << i):
-            result[3 - i] = cursor.read(1)[0]
+            result[3 - i] = data[position]
+            position += 1
 
-    return int.from_bytes(result, byteorder="little")
+    return int.from_bytes(result, byteorder="little"), position
 
 
 def do_replacements(text: str) -> str:
     """Replaces specific characters in text based on the REPLACEMENTS map."""
-    for needle, replacement in REPLACEMENTS.items():
-        text = text.replace(needle, replacement)
-    return text
+    return text.translate(REPLACEMENTS_TABLE)
 
 
-def fetch_reports(last_evaluated_key=None):
-    """Fetches a batch of reports from DynamoDB."""
-    params = {"TableName": TABLE_NAME}
+def fetch_reports(last_evaluated_key=None, limit=None):
+    """Fetches a batch of reports from DynamoDB, only including the attributes that are used."""
+    params = {
+        "TableName": TABLE_NAME,
+        "ProjectionExpression": ", ".join(f"#{name}" for name in REPORT_ATTRIBUTES),
+        "ExpressionAttributeNames": {f"#{name}": name for name in REPORT_ATTRIBUTES},
+    }
     if last_evaluated_key:
         params["ExclusiveStartKey"] = last_evaluated_key
+    if limit:
+        params["Limit"] = limit
 
     response = dynamodb.scan(**params)
     return response.get("Items", []), response.get("LastEvaluatedKey")
 
 
-def is_base64(data: bytes) -> bool:
-    """Checks if the given data is valid Base64."""
-    try:
-        base64.b64decode(data)
-        return True
-    except (binascii.Error, ValueError):
-        return False
-
-
 def process_item(item):
     def decode_field(field):
         """Safely decodes a Base64 field if possible."""
-        if is_base64(field):
-            return base64.b64decode(field)
-        return field  # Return raw if not Base64
+        try:
+            return base64.b64decode(field, validate=True)
+        except (binascii.Error, ValueError):
+            return field  # Return raw if not Base64
 
     try:
         sender = decode_field(item["sender"]["B"])
@@ -92,6 +102,8 @@ def process_item(item):
         print(f"Missing field in item: {e}")
         return None  # Skip if fields are missing
 
+    # The chained str.replace calls are kept on purpose, each is a single C scan and they
+    # measured faster than both str.translate and a precompiled re.sub on report content
     return {
         "sender": do_replacements(get_text(sender)),
         "content": do_replacements(get_text(content)).replace("\r\n", " ").replace("\r", " ").replace("\n", " ").strip(),
@@ -150,69 +162,89 @@ def prompt_reclassify() -> str:
         print("Invalid choice. Please try again.")
 
 
-def write_to_csv(csv_writer, classification, message_type, content, file):
-    """Writes a record to the CSV file and flushes the buffer."""
+def write_to_csv(csv_writer, classification, message_type, content):
+    """Writes a record to the CSV file."""
     csv_writer.writerow([classification, message_type, content])
-    file.flush()  # Ensure immediate write to the file
 
 
-def delete_report(report_id: str):
-    """Deletes a report from DynamoDB."""
-    try:
-        dynamodb.delete_item(
-            TableName=TABLE_NAME,
-            Key={"id": {"S": report_id}}
-        )
-        print(f"Deleted report with ID: {report_id}")
-    except Exception as e:
-        print(f"Failed to delete report with ID: {report_id}. Error: {e}")
+def delete_reports(report_ids: list):
+    """Deletes reports from DynamoDB, in batches."""
+    failed = delete_ids(dynamodb, TABLE_NAME, report_ids)
+    for report_id in report_ids:
+        if report_id in failed:
+            print(f"Failed to delete report with ID: {report_id}. Error: {failed[report_id]}")
+        else:
+            print(f"Deleted report with ID: {report_id}")
+
+
+def queue_delete(pending_deletes: list, report_id: str, file):
+    """Queues a report for deletion, deleting the queued reports once a full batch is ready."""
+    pending_deletes.append(report_id)
+    if len(pending_deletes) >= BATCH_SIZE:
+        file.flush()  # Never delete a report before its row has been written
+        delete_reports(pending_deletes)
+        pending_deletes.clear()
 
 
 def review_reports(output_file: str, auto_accept: bool):
     """Main function to review and process reports."""
     last_evaluated_key = None
     batch_number = 0
+    pending_deletes = []
 
     with open(output_file, mode="a", newline="") as file:
-        csv_writer = csv.writer(file)
-
-        while True:
-            batch_number += 1
-            items, last_evaluated_key = fetch_reports(last_evaluated_key)
-
-            if not items and not last_evaluated_key:
-                break  # Exit loop when there are no more items and no last key
-
-            print(f"Batch {batch_number} with {len(items)} item(s) to review...")
-            print(f"LastEvaluatedKey: {last_evaluated_key}")
-
-            for item in items:
-                processed = process_item(item)
-                if not processed:
-                    continue
-
-                if auto_accept:
-                    classification = processed["suggested_classification"]
-                    message_type = processed["type"]
-                    write_to_csv(csv_writer, classification, message_type, processed["content"], file)
-                    delete_report(processed["id"])
-                else:
-                    display_item(processed)
-                    action = prompt_action()
-                    if action == "s":
+        # Plain "\n" rows, matching the existing training data and saving a byte per row
+        csv_writer = csv.writer(file, lineterminator="\n")
+
+        try:
+            while True:
+                batch_number += 1
+                items, last_evaluated_key = fetch_reports(last_evaluated_key, None if auto_accept else REVIEW_PAGE_SIZE)
+
+                if not items and not last_evaluated_key:
+                    break  # Exit loop when there are no more items and no last key
+
+                print(f"Batch {batch_number} with {len(items)} item(s) to review...")
+                print(f"LastEvaluatedKey: {last_evaluated_key}")
+
+                for item in items:
+                    processed = process_item(item)
+                    if not processed:
                         continue
-                    elif action == "d":
-                        delete_report(processed["id"])
-                    elif action in {"a", "k"}:
-                        classification = processed["suggested_classification"] if action == "a" else processed["reason"]
-                        message_type = processed["type"]  # Numeric type
-                        write_to_csv(csv_writer, classification, message_type, processed["content"], file)
-                        delete_report(processed["id"])
-                    elif action == "r":
-                        classification = prompt_reclassify()
-                        message_type = processed["type"]  # Numeric type
-                        write_to_csv(csv_writer, classification, message_type, processed["content"], file)
-                        delete_report(processed["id"])
+
+                    if auto_accept:
+                        classification = processed["suggested_classification"]
+                        message_type = processed["type"]
+                        write_to_csv(csv_writer, classification, message_type, processed["content"])
+                        queue_delete(pending_deletes, processed["id"], file)
+                    else:
+                        display_item(processed)
+                        action = prompt_action()
+                        if action == "s":
+                            continue
+                        elif action == "d":
+                            queue_delete(pending_deletes, processed["id"], file)
+                        elif action in {"a", "k"}:
+                            classification = processed["suggested_classification"] if action == "a" else processed["reason"]
+                            message_type = processed["type"]  # Numeric type
+                            write_to_csv(csv_writer, classification, message_type, processed["content"])
+                            queue_delete(pending_deletes, processed["id"], file)
+                        elif action == "r":
+                            classification = prompt_reclassify()
+                            message_type = processed["type"]  # Numeric type
+                            write_to_csv(csv_writer, classification, message_type, processed["content"])
+                            queue_delete(pending_deletes, processed["id"], file)
+                        file.flush()  # Keep the file current while reviewing interactively
+
+                # The scan starts over once the table has been read, so the reports handled
+                # on this page have to be gone before the next page is fetched
+                file.flush()
+                delete_reports(pending_deletes)
+                pending_deletes.clear()
+        finally:
+            # Delete whatever is still queued, even if the review was interrupted
+            file.flush()
+            delete_reports(pending_deletes)
 
 
 if __name__ == "__main__":